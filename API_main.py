@@ -1,27 +1,51 @@
 # pylint: disable-all
+import inspect
 import multiprocessing
+import os
 import signal
 import socket
+import threading
 import logging
 import uvicorn
+from uvicorn.supervisors import Multiprocess
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 定义服务端口和 worker 数量，所有 worker 共享同一个监听端口，由内核分发连接
+PORT = 6688
+WORKERS = os.cpu_count() or 1
+
+# 启动时解析一次本机 IP
+try:
+    HOST_IP = socket.gethostbyname(socket.gethostname())
+except socket.gaierror as e:
+    logger.warning("Failed to resolve host IP, falling back to 127.0.0.1: %s", e)
+    HOST_IP = "127.0.0.1"
+
 # 定义启动服务器的函数
-def start_server(port, stop_event, queue):
-    host_ip = socket.gethostbyname(socket.gethostname())
-    server_address = f"http://{host_ip}:{port}/docs"
-    
-    logger.info("Starting FastAPI server on %s", server_address)
+def start_server(port, workers, stop_event):
+    server_address = f"http://{HOST_IP}:{port}/docs"
     
-    queue.put(server_address)
+    logger.info("Starting FastAPI server on %s with %d workers", server_address, workers)
     
-    config = uvicorn.Config("StupidOCR:app", host="0.0.0.0", port=port, log_level="info")
-    server = uvicorn.Server(config)
-    
-    while not stop_event.is_set():
-        server.run()
+    # worker 根据 WEB_CONCURRENCY 平分 ONNX 推理线程
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    config = uvicorn.Config("StupidOCR:app", host="0.0.0.0", port=port, workers=workers, log_level="info")
+    sock = config.bind_socket()
+    supervisor_kwargs = {"sockets": [sock]}
+    if "target" in inspect.signature(Multiprocess.__init__).parameters:
+        # uvicorn < 0.51 需要显式传入 worker 入口，之后的版本由 supervisor 自行创建 Server
+        supervisor_kwargs["target"] = uvicorn.Server(config).run
+    supervisor = Multiprocess(config, **supervisor_kwargs)
+
+    # 后台线程等待停止事件，事件触发后通知 supervisor 优雅关闭所有 worker
+    def watch_stop_event():
+        stop_event.wait()
+        supervisor.should_exit.set()
+
+    threading.Thread(target=watch_stop_event, daemon=True).start()
+    supervisor.run()
     
     logger.info(f"Server on port {port} has been stopped.")
 
@@ -36,32 +60,25 @@ def signal_handler(sig, frame):
 
 # 定义主函数模块
 def main():
-    # 定义服务端口
-    ports = [
-        6688, 6689, 6690, 6691, 6692, 6693, 6694, 6695, 6696, 6697,
-        6698, 6699, 6700, 6701, 6702, 6703, 6704, 6705, 6706, 6707
-    ]
-    
     global processes, stop_events
     processes = []
     stop_events = []
-    queue = multiprocessing.Queue()  # 使用 multiprocessing.Queue 代替 SimpleQueue
     
-    for port in ports:
-        stop_event = multiprocessing.Event()
-        process = multiprocessing.Process(target=start_server, args=(port, stop_event, queue))
-        processes.append(process)
-        stop_events.append(stop_event)
-        process.start()
+    stop_event = multiprocessing.Event()
+    process = multiprocessing.Process(target=start_server, args=(PORT, WORKERS, stop_event))
+    processes.append(process)
+    stop_events.append(stop_event)
+    process.start()
 
     # 注册信号处理程序
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
 
-    logger.info("OCR Service Manager started. Servers are running on the following URLs:")
-    while True:
-        url = queue.get()
-        logger.info(url)
+    logger.info("OCR Service Manager started. Press Ctrl+C to stop.")
+    # 服务进程自行输出访问地址；主进程只等待其退出，收到信号时由 signal_handler 负责关闭
+    for process in processes:
+        process.join()
+    logger.info("All servers have exited.")
 
 if __name__ == "__main__":
     main()
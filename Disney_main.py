@@ -1,25 +1,65 @@
 # pylint: disable-all
 import json
-import nest_asyncio
 import asyncio
 import logging
 import os
 import datetime
 from typing import List, Optional
-from playwright.async_api import async_playwright, Browser, Page, ElementHandle
-import requests
-from FastApiServiceManager import recognize_captcha, recognize_captcha_local
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, ElementHandle
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+import orjson
+from FastApiServiceManager import close_session, get_session, recognize_captcha, recognize_captcha_local
 
 # Set up logging
 logger = logging.getLogger("PlaywrightAutomation")
 logging.basicConfig(level=logging.INFO)
 
-nest_asyncio.apply()
+# 有 uvloop 时使用更快的事件循环实现（Windows 上不可用）
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+def run_async(coro):
+    """
+    运行协程直到完成，有 uvloop 时使用 uvloop 事件循环。只影响本次运行，不修改全局事件循环策略。
+
+    :param coro: 要运行的协程
+    :return: 协程的返回值
+    """
+    if uvloop is None:
+        return asyncio.run(coro)
+    return uvloop.run(coro)
+
+# 提取验证码图片 base64 和输入框选择器的脚本，三种验证码图片选择器合并为一次 querySelector
+CAPTCHA_EXTRACT_JS = """
+() => {
+    const captchaImg = document.querySelector(
+        '#challenge-container > div > fieldset > div.botdetect-label > img, ' +
+        'img.captcha-code, ' +
+        '#challenge-container > div > fieldset > div:first-of-type > img'
+    );
+    const inputElement = document.querySelector('#solution, [name="CaptchaCode"]');
+
+    if (!captchaImg || !inputElement) {
+        return null;
+    }
+    const src = captchaImg.getAttribute('src');
+    return {
+        captchaBase64: src.split(',')[1],
+        inputSelector: inputElement.id === 'solution' ? '#solution' : '[name="CaptchaCode"]'
+    };
+}
+"""
+
+# 验证码通过后跳转到的排队页面上的排队人数元素
+QUEUE_COUNTER_SELECTOR = "#MainPart_lbUsersInLineAheadOfYou"
 
 class PlaywrightAutomation:
-    def __init__(self, max_retries: int = 3, retry_delay: int = 5):
-        self.browser: Browser = None
-        self.context = None
+    def __init__(self, browser: Browser, max_retries: int = 3, retry_delay: int = 5):
+        # 浏览器由 main() 统一启动并在所有实例间共享，每个实例只持有自己的 context
+        self.browser: Browser = browser
+        self.context: Optional[BrowserContext] = None
         self.page: Page = None
         self.max_retries = max_retries
         self.retry_delay = retry_delay
@@ -28,22 +68,29 @@ class PlaywrightAutomation:
         attempts = 0
         while attempts < self.max_retries:
             try:
-                playwright = await async_playwright().start()
-                self.browser = await playwright.chromium.launch(headless=True)
+                await self.close_context()
                 self.context = await self.browser.new_context()
                 self.page = await self.context.new_page()
-                logger.info(f"浏览器成功初始化")
+                logger.info(f"浏览器上下文成功初始化")
                 return
             except Exception as e:
                 attempts += 1
-                logger.error(f"浏览器初始化失败 (尝试 {attempts}/{self.max_retries}): {e}")
-                if self.browser:
-                    await self.browser.close()
+                logger.error(f"浏览器上下文初始化失败 (尝试 {attempts}/{self.max_retries}): {e}")
+                await self.close_context()
                 if attempts < self.max_retries:
                     await asyncio.sleep(self.retry_delay)
                 else:
                     raise
 
+    async def close_context(self):
+        if self.context:
+            try:
+                await self.context.close()
+            except Exception as e:
+                logger.warning(f"关闭浏览器上下文时出错: {e}")
+            self.context = None
+            self.page = None
+
     async def navigate_to_url(self, url: str):
         attempts = 0
         while attempts < self.max_retries:
@@ -76,25 +123,7 @@ class PlaywrightAutomation:
             try:
                 logger.info(f"验证码识别和提交尝试 {attempt + 1} / {max_attempts}")
 
-                script = """
-                (function() {
-                    let captchaImg = document.querySelector("#challenge-container > div > fieldset > div.botdetect-label > img") ||
-                                    document.querySelector("img.captcha-code") ||
-                                    document.evaluate('//*[@id="challenge-container"]/div/fieldset/div[1]/img', document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
-                                    
-                    let inputElement = document.querySelector("#solution") ||
-                                    document.querySelector('[name="CaptchaCode"]');
-
-                    if (captchaImg && inputElement) {
-                        let src = captchaImg.getAttribute('src');
-                        let captchaBase64 = src.split(',')[1];
-                        return {captchaBase64: captchaBase64, inputSelector: "#solution"};
-                    } else {
-                        return null;
-                    }
-                })();
-                """
-                element_info = await self.page.evaluate(script)
+                element_info = await self.page.evaluate(CAPTCHA_EXTRACT_JS)
 
                 if not element_info:
                     logger.error("未找到验证码图片或输入框")
@@ -121,12 +150,12 @@ class PlaywrightAutomation:
 
                 await input_element.fill(captcha_text)
                 await self.page.click("#challenge-container > button")
-                await self.page.wait_for_timeout(6000)
-
-                if not await self.page.is_visible("#challenge-container"):
+                # 提交后页面会跳转，跳转途中验证码容器会短暂消失，因此以排队人数出现作为成功标志，最多等待原来固定的 6 秒
+                try:
+                    await self.page.wait_for_selector(QUEUE_COUNTER_SELECTOR, state='visible', timeout=6000)
                     logger.info("验证码提交成功")
                     return True
-                else:
+                except PlaywrightTimeoutError:
                     logger.warning("验证码提交失败，重新尝试")
                 
                 # 指数退避：每次重试等待时间翻倍
@@ -149,7 +178,7 @@ class PlaywrightAutomation:
 
     async def get_queue_info(self):
         try:
-            await self.page.wait_for_selector('#MainPart_lbUsersInLineAheadOfYou', timeout=40000)
+            await self.page.wait_for_selector(QUEUE_COUNTER_SELECTOR, state='visible', timeout=15000)
             queue_number = await self.page.evaluate("parseInt(document.querySelector('#MainPart_lbUsersInLineAheadOfYou').innerText)")
             queue_id = await self.page.evaluate("document.querySelector('#hlLinkToQueueTicket2').innerText")
             logger.info(f"UUID: {queue_id}, 在你前面的用户数: {queue_number}")
@@ -158,41 +187,65 @@ class PlaywrightAutomation:
             queue_info = {"uuid": queue_id, "head_number": queue_number}
             
             # 调用插入数据库的函数
-            self.update_database(queue_info)
+            await self.update_database(queue_info)
             
             return queue_info
         except Exception as e:
             logger.error(f"获取队列信息时出错: {e}")
             return None
 
-    def update_database(self, queue_info: dict):
+    async def update_database(self, queue_info: dict):
         try:
             url = 'http://101.132.122.123:17070/update_uuid'
             headers = {'Content-Type': 'application/json'}
-            response = requests.post(url, headers=headers, data=json.dumps(queue_info))
-
-            if response.status_code == 200:
-                logger.info(f"成功插入数据库: {queue_info}")
-            else:
-                logger.error(f"插入数据库失败，状态码: {response.status_code}，响应: {response.text}")
+            session = await get_session()
+            async with session.post(url, headers=headers, data=orjson.dumps(queue_info)) as response:
+                if response.status == 200:
+                    logger.info(f"成功插入数据库: {queue_info}")
+                else:
+                    error = await response.text()
+                    logger.error(f"插入数据库失败，状态码: {response.status}，响应: {error}")
         except Exception as e:
             logger.error(f"插入数据库时出错: {e}")
 
 
 async def main():
     page_count = 20
+    max_concurrency = 8
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
     data_dir = "data"
     os.makedirs(data_dir, exist_ok=True)
     results = []
 
-    tasks = []
+    # 只启动一个浏览器，每个实例使用独立的 context 进行隔离
+    playwright = await async_playwright().start()
+    browser = await playwright.chromium.launch(headless=True)
+
+    # 实例编号放入队列，由固定数量的 worker 依次领取，限制同时打开的 context 数量
+    queue: asyncio.Queue = asyncio.Queue()
     for i in range(page_count):
-        automation = PlaywrightAutomation()
-        task = run_automation(automation, i + 1, timestamp, data_dir, results)
-        tasks.append(task)
+        queue.put_nowait(i + 1)
+
+    async def worker():
+        while True:
+            index = await queue.get()
+            try:
+                automation = PlaywrightAutomation(browser)
+                await run_automation(automation, index, timestamp, data_dir, results)
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(max_concurrency, page_count))]
     
-    await asyncio.gather(*tasks)
+    try:
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await close_session()
+        await browser.close()
+        await playwright.stop()
 
     results_path = os.path.join(data_dir, f"results_{timestamp}.json")
     with open(results_path, 'w', encoding='utf-8') as f:
@@ -208,7 +261,6 @@ async def run_automation(automation: PlaywrightAutomation, index: int, timestamp
         if success:
             logger.info(f"实例 {index} 成功通过验证码")
             try:
-                await automation.page.wait_for_timeout(10000)  # 等待 10 秒以确保页面完全加
                 queue_info = await asyncio.wait_for(automation.get_queue_info(), timeout=30)  # 设置超时时间为10秒
                 if queue_info:
                     logger.info(f"实例 {index} 获取到的队列信息: {queue_info}")
@@ -230,8 +282,7 @@ async def run_automation(automation: PlaywrightAutomation, index: int, timestamp
         logger.error(f"实例 {index} 出现错误: {e}")
         results.append({"instance": index, "status": "error", "error": str(e)})
     finally:
-        if automation.browser:
-            await automation.browser.close()
+        await automation.close_context()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_async(main())
@@ -1,7 +1,7 @@
 # pylint: disable-all
 import asyncio
 import aiohttp
-import json
+import orjson
 import logging
 import os
 import sys
@@ -13,6 +13,37 @@ import base64
 logger = logging.getLogger("FastApiServiceManager")
 api_address = None
 
+# 本地 OCR 服务端口（单端口多 worker，由内核在 worker 之间分发连接）
+LOCAL_OCR_PORTS = [6688]
+# 本地识别的总超时时间（秒）
+LOCAL_OCR_TIMEOUT = 30
+
+# 模块级共享的 aiohttp 会话，复用连接池中的长连接
+_session = None
+
+async def get_session():
+    """
+    获取共享的 aiohttp 会话，首次调用时创建。
+
+    :return: aiohttp.ClientSession
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=64, limit_per_host=32, keepalive_timeout=30)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def close_session():
+    """
+    关闭共享的 aiohttp 会话。应在事件循环结束前调用。
+
+    :return: None
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 def get_secure_absolute_path(relative_path):
     """
     获取安全的绝对路径，并确保目录存在且具有适当的权限。
@@ -53,19 +84,19 @@ async def initialize_api_address():
     """
     global api_address
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get("http://www.bobott.cn:6688/api/address") as response:
-                logger.info(f"收到响应。状态码: {response.status}")
-                if response.status == 200:
-                    result = await response.text()
-                    logger.info(f"响应内容: {result}")
-                    api_response = json.loads(result)
-                    api_address = api_response["address"]
-                    logger.info(f"API 地址已初始化: {api_address}")
-                else:
-                    error = await response.text()
-                    logger.error(f"获取 API 地址失败: {response.status}, 错误: {error}")
-                    raise Exception(f"获取 API 地址失败: {response.status}")
+        session = await get_session()
+        async with session.get("http://www.bobott.cn:6688/api/address") as response:
+            logger.info(f"收到响应。状态码: {response.status}")
+            if response.status == 200:
+                result = await response.read()
+                logger.info(f"响应内容: {result}")
+                api_response = orjson.loads(result)
+                api_address = api_response["address"]
+                logger.info(f"API 地址已初始化: {api_address}")
+            else:
+                error = await response.text()
+                logger.error(f"获取 API 地址失败: {response.status}, 错误: {error}")
+                raise Exception(f"获取 API 地址失败: {response.status}")
     except Exception as ex:
         logger.error(f"初始化 API 地址时出错: {ex}")
         raise
@@ -83,29 +114,29 @@ async def recognize_captcha(img_base64):
         await initialize_api_address()
 
     try:
-        async with aiohttp.ClientSession() as session:
-            if api_address:
-                url = f"{api_address}/api/ocr/image"
-                logger.info(f"使用 API 地址: {api_address}")
-
-                request_body = {"img_base64": img_base64}
-                json_request_body = json.dumps(request_body)
-                logger.info(f"请求体: {json_request_body}")
-
-                async with session.post(url, data=json_request_body, headers={"Content-Type": "application/json"}) as response:
-                    logger.info(f"收到响应。状态码: {response.status}")
-                    if response.status == 200:
-                        result = await response.text()
-                        logger.info(f"响应内容: {result}")
-                        captcha_result = json.loads(result)
-                        captcha_text = captcha_result["result"]
-                        captcha_text = captcha_text.replace(" ", "").strip()
-                        logger.info(f"验证码识别成功。结果: {captcha_text}")
-                        return captcha_text
-                    else:
-                        error = await response.text()
-                        logger.error(f"验证码识别失败: {response.status}, 错误: {error}")
-                        return None
+        session = await get_session()
+        if api_address:
+            url = f"{api_address}/api/ocr/image"
+            logger.info(f"使用 API 地址: {api_address}")
+
+            request_body = {"img_base64": img_base64}
+            json_request_body = orjson.dumps(request_body)
+            logger.info(f"请求体: {json_request_body}")
+
+            async with session.post(url, data=json_request_body, headers={"Content-Type": "application/json"}) as response:
+                logger.info(f"收到响应。状态码: {response.status}")
+                if response.status == 200:
+                    result = await response.read()
+                    logger.info(f"响应内容: {result}")
+                    captcha_result = orjson.loads(result)
+                    captcha_text = captcha_result["result"]
+                    captcha_text = captcha_text.replace(" ", "").strip()
+                    logger.info(f"验证码识别成功。结果: {captcha_text}")
+                    return captcha_text
+                else:
+                    error = await response.text()
+                    logger.error(f"验证码识别失败: {response.status}, 错误: {error}")
+                    return None
     except Exception as ex:
         logger.error(f"识别验证码时出错: {ex}")
         return None
@@ -117,39 +148,44 @@ async def recognize_captcha_local(img_base64):
     :param img_base64: 验证码图片的 base64 编码
     :return: 识别出的验证码文本及端口号
     """
-    available_ports = [6688, 6689, 6690, 6691, 6692, 6693, 6694, 6695, 6696, 6697, 6698, 6699, 6700, 6701, 6702, 6703, 6704, 6705, 6706, 6707]
-    tasks = []
+    # 只解码一次，向本地服务发送原始字节
+    img_bytes = base64.b64decode(img_base64)
+    tasks = [asyncio.create_task(try_local_port(img_bytes, port)) for port in LOCAL_OCR_PORTS]
 
-    for port in available_ports:
-        tasks.append(try_local_port(img_base64, port))
-
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    for result in results:
-        if isinstance(result, tuple) and result[0] is not None:
-            return result
+    try:
+        # 取第一个成功的结果即可，不必等待最慢的端口
+        for next_done in asyncio.as_completed(tasks, timeout=LOCAL_OCR_TIMEOUT):
+            result = await next_done
+            if isinstance(result, tuple) and result[0] is not None:
+                return result
+    except asyncio.TimeoutError:
+        logger.error(f"本地验证码识别超时 ({LOCAL_OCR_TIMEOUT} 秒)")
+    finally:
+        # 取消仍在进行中的请求，aiohttp 会中止对应的连接
+        for task in tasks:
+            if not task.done():
+                task.cancel()
     return None, None
 
-async def try_local_port(img_base64, port):
+async def try_local_port(img_bytes, port):
     """
     尝试使用本地服务端口识别验证码。
 
-    :param img_base64: 验证码图片的 base64 编码
+    :param img_bytes: 验证码图片的原始字节
     :param port: 本地服务端口
     :return: 识别出的验证码文本及端口号
     """
     try:
-        async with aiohttp.ClientSession() as session:
-            url = f"http://127.0.0.1:{port}/api/ocr/image"
-            request_body = {"img_base64": img_base64}
-            json_request_body = json.dumps(request_body)
-
-            async with session.post(url, data=json_request_body, headers={"Content-Type": "application/json"}) as response:
-                if response.status == 200:
-                    result = await response.text()
-                    captcha_result = json.loads(result)
-                    captcha_text = captcha_result["result"]
-                    captcha_text = captcha_text.replace(" ", "").strip()
-                    return captcha_text, port
+        session = await get_session()
+        url = f"http://127.0.0.1:{port}/api/ocr/image_raw"
+
+        async with session.post(url, data=img_bytes, headers={"Content-Type": "application/octet-stream"}) as response:
+            if response.status == 200:
+                result = await response.read()
+                captcha_result = orjson.loads(result)
+                captcha_text = captcha_result["result"]
+                captcha_text = captcha_text.replace(" ", "").strip()
+                return captcha_text, port
     except Exception as ex:
         logger.error(f"在端口 {port} 进行本地验证码识别时出错: {ex}")
     return None, None
@@ -2,10 +2,13 @@
 
 import base64
 from io import BytesIO
+import os
 import ddddocr
+import onnxruntime
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from PIL import Image
 from pydantic import BaseModel
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -13,12 +16,23 @@ import socket
 import argparse
 import logging
 import asyncio
+import operator
+import re
+import threading
 import time
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 启动时解析一次本机 IP，避免每次请求都做阻塞的 DNS 查询
+try:
+    HOST_IP = socket.gethostbyname(socket.gethostname())
+except socket.gaierror as e:
+    logger.warning("Failed to resolve host IP, falling back to 127.0.0.1: %s", e)
+    HOST_IP = "127.0.0.1"
+ADDRESS_TEMPLATE = f"http://{HOST_IP}:{{port}}"
+
 # 创建 FastAPI 实例
 app = FastAPI()
 
@@ -32,7 +46,7 @@ description = """
 * 识别效果完全靠玄学，可能可以识别，可能不能识别。——DDDDOCR
 """
 
-app = FastAPI(title="StupidOCR", description=description, version="1.0.8")
+app = FastAPI(title="StupidOCR", description=description, version="1.0.8", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -53,16 +67,98 @@ class TimeoutMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(TimeoutMiddleware)
 
+# 每个 worker 的 ONNX 推理线程数：按 worker 数平分 CPU，避免 worker 数 × 线程数超过核心数
+ORT_THREADS = max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get("WEB_CONCURRENCY", 1))))
+# quantize_models.py 生成的 INT8 模型目录
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+def tune_ort_session(instance):
+    """
+    使用限定线程数和全量图优化重建 DdddOcr 内部的 ONNX 会话，存在 INT8 量化模型时优先加载。
+
+    :param instance: DdddOcr 实例
+    :return: None
+    """
+    session = getattr(instance, "_DdddOcr__ort_session", None)
+    model_path = getattr(session, "_model_path", None)
+    if not model_path:
+        # 依赖 ddddocr 1.5.x 的私有属性，其他版本无法限制线程数或加载 INT8 模型
+        logger.error("Cannot tune ONNX session for %s (requires ddddocr<1.6), keeping defaults", type(instance).__name__)
+        return
+    quantized_path = os.path.join(MODELS_DIR, os.path.basename(model_path)[:-len(".onnx")] + ".int8.onnx")
+    if os.path.exists(quantized_path):
+        logger.info("Using quantized model %s", quantized_path)
+        model_path = quantized_path
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = ORT_THREADS
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    instance._DdddOcr__ort_session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=session.get_providers())
+
 ocr = ddddocr.DdddOcr(show_ad=False, beta=True)
-number_ocr = ddddocr.DdddOcr(show_ad=False, beta=True)
-number_ocr.set_ranges(0)
-compute_ocr = ddddocr.DdddOcr(show_ad=False, beta=True)
-compute_ocr.set_ranges("0123456789+-x÷=")
-alphabet_ocr = ddddocr.DdddOcr(show_ad=False, beta=True)
-alphabet_ocr.set_ranges(3)
+tune_ort_session(ocr)
 det = ddddocr.DdddOcr(det=True, show_ad=False)
+tune_ort_session(det)
 shadow_slide = ddddocr.DdddOcr(det=False, ocr=False, show_ad=False)
 
+# 数字、算术、字母三个接口共享同一个模型实例，识别前按需切换字符集
+NUMBER_RANGES = 0
+COMPUTE_RANGES = "0123456789+-x÷="
+ALPHABET_RANGES = 3
+range_ocr = ddddocr.DdddOcr(show_ad=False, beta=True)
+tune_ort_session(range_ocr)
+range_ocr_lock = threading.Lock()
+range_ocr_current = None
+
+def classify_with_ranges(img, ranges):
+    """
+    使用指定字符集识别图片，返回概率最高的字符组成的字符串。
+
+    :param img: 图片字节
+    :param ranges: 传给 set_ranges 的字符集
+    :return: 识别结果
+    """
+    global range_ocr_current
+    with range_ocr_lock:
+        if range_ocr_current != ranges:
+            range_ocr.set_ranges(ranges)
+            range_ocr_current = ranges
+        result = range_ocr.classification(img, probability=True)
+    return "".join(result['charsets'][i.index(max(i))] for i in result['probability'])
+
+# 算术验证码只包含 “数字 运算符 数字” 的简单表达式
+COMPUTE_PATTERN = re.compile(r'(\d+)([+\-*/])(\d+)')
+COMPUTE_OPERATORS = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv}
+
+def evaluate_expression(string):
+    """
+    计算算术验证码表达式，代替 eval。
+
+    :param string: 形如 "12+3" 的表达式
+    :return: 计算结果
+    """
+    match = COMPUTE_PATTERN.fullmatch(string)
+    if not match:
+        raise ValueError(f"Unsupported expression: {string!r}")
+    left, op_char, right = match.groups()
+    return COMPUTE_OPERATORS[op_char](int(left), int(right))
+
+def detect_and_classify(img):
+    """
+    检测图片中的文字框并逐个识别，返回文字到框中心坐标的映射。
+
+    :param img: 图片字节
+    :return: {文字: [x, y]}
+    """
+    # 只解码一次，后续裁剪都基于已加载的像素数据
+    img_pil = Image.open(BytesIO(img))
+    img_pil.load()
+    result = {}
+    for box in det.detection(img):
+        text = ocr.classification(img_pil.crop(box))
+        result[text] = [box[0] + (box[2] - box[0]) // 2, box[1] + (box[3] - box[1]) // 2]
+    return result
+
 class ModelImageIn(BaseModel):
     img_base64: str
 
@@ -88,12 +184,22 @@ async def ocr_image(data: ModelImageIn):
         logger.error("Error processing image: %s", e)
         raise HTTPException(status_code=500, detail=str(e)) from e
 
+@app.post("/api/ocr/image_raw", summary="通用（原始字节）", tags=["验证码识别"])
+async def ocr_image_raw(request: Request):
+    # 请求体为 application/octet-stream 的图片原始字节，省去 base64 编解码
+    try:
+        img = await request.body()
+        result = await asyncio.to_thread(ocr.classification, img)
+        return {"result": result}
+    except Exception as e:
+        logger.error("Error processing image: %s", e)
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
 @app.post("/api/ocr/number", summary="数字", tags=["验证码识别"])
 async def ocr_image_number(data: ModelImageIn):
     try:
         img = base64.b64decode(data.img_base64)
-        result = await asyncio.to_thread(number_ocr.classification, img, probability=True)
-        string = "".join(result['charsets'][i.index(max(i))] for i in result['probability'])
+        string = await asyncio.to_thread(classify_with_ranges, img, NUMBER_RANGES)
         return {"result": string}
     except Exception as e:
         logger.error("Error processing image: %s", e)
@@ -103,11 +209,10 @@ async def ocr_image_number(data: ModelImageIn):
 async def ocr_image_compute(data: ModelImageIn):
     try:
         img = base64.b64decode(data.img_base64)
-        result = await asyncio.to_thread(compute_ocr.classification, img, probability=True)
-        string = "".join(result['charsets'][i.index(max(i))] for i in result['probability'])
+        string = await asyncio.to_thread(classify_with_ranges, img, COMPUTE_RANGES)
         string = string.split("=")[0].replace("x", "*").replace("÷", "/")
         try:
-            result = eval(string)
+            result = evaluate_expression(string)
         except Exception as eval_error:
             logger.error("Error evaluating string: %s", eval_error)
             result = "Error"
@@ -120,8 +225,7 @@ async def ocr_image_compute(data: ModelImageIn):
 async def ocr_image_alphabet(data: ModelImageIn):
     try:
         img = base64.b64decode(data.img_base64)
-        result = await asyncio.to_thread(alphabet_ocr.classification, img, probability=True)
-        string = "".join(result['charsets'][i.index(max(i))] for i in result['probability'])
+        string = await asyncio.to_thread(classify_with_ranges, img, ALPHABET_RANGES)
         return {"result": string}
     except Exception as e:
         logger.error("Error processing image: %s", e)
@@ -131,9 +235,7 @@ async def ocr_image_alphabet(data: ModelImageIn):
 async def ocr_image_det(data: ModelImageIn):
     try:
         img = base64.b64decode(data.img_base64)
-        img_pil = Image.open(BytesIO(img))
-        res = await asyncio.to_thread(det.detection, img)
-        result = {await asyncio.to_thread(ocr.classification, img_pil.crop(box)): [box[0] + (box[2] - box[0]) // 2, box[1] + (box[3] - box[1]) // 2] for box in res}
+        result = await asyncio.to_thread(detect_and_classify, img)
         return {"result": result}
     except Exception as e:
         logger.error("Error processing image: %s", e)
@@ -165,10 +267,11 @@ async def ocr_image_slider_shadow(data: ModelSliderImageIn):
 @app.get("/api/address", summary="获取API地址", tags=["系统"])
 def get_address(request: Request):
     try:
-        host_name = socket.gethostname()
-        host_ip = socket.gethostbyname(host_name)
-        port = request.app.state.port
-        return {"address": f"http://{host_ip}:{port}"}
+        port = getattr(request.app.state, "port", None)
+        if port is None:
+            # Host 头可能不带端口（如经由 80 端口的反向代理），改用服务实际监听的端口
+            port = request.scope["server"][1]
+        return {"address": ADDRESS_TEMPLATE.format(port=port)}
     except Exception as e:
         logger.error("Error getting address: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -179,10 +282,8 @@ if __name__ == "__main__":
     args = parser.parse_args()
     app.state.port = args.port
     
-    host_ip = socket.gethostbyname(socket.gethostname())
-    
     # 拼接 API 文档的地址
-    server_address = f"http://{host_ip}:{args.port}/docs"
+    server_address = f"{ADDRESS_TEMPLATE.format(port=args.port)}/docs"
     logger.info(f"FastAPI docs available at {server_address}")
     
     uvicorn.run(app, host="0.0.0.0", port=args.port)
@@ -1,6 +1,7 @@
 # pylint: disable-all
 import os
 import sys
+from pathlib import Path
 
 # 获取当前脚本所在目录（项目根目录的假设路径）
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,30 +12,43 @@ sys.path.insert(0, script_dir)
 # 项目根目录路径（假设脚本在项目根目录中）
 root_dir = script_dir
 
+PYLINT_HEADER = "# pylint: disable-all\n"
+
+# 不需要处理的目录
+EXCLUDED_DIRS = {".git", ".venv", "venv", "__pycache__", ".mypy_cache", ".pytest_cache", ".tox", ".nox"}
+
+def iter_python_files(root):
+    for path in Path(root).rglob("*.py"):
+        if EXCLUDED_DIRS.isdisjoint(path.relative_to(root).parts[:-1]):
+            yield path
+
 # 遍历项目中的所有 Python 文件
-for subdir, _, files in os.walk(root_dir):
-    for file in files:
-        if file.endswith(".py"):
-            file_path = os.path.join(subdir, file)
-            try:
-                with open(file_path, "r+", encoding="utf-8") as f:
-                    lines = f.readlines()
-
-                    # 如果文件的第一行已经是 pylint 注释，更新它
-                    if lines and lines[0].startswith("# pylint: disable-all"):
-                        lines[0] = "# pylint: disable-all\n"
-                    else:
-                        # 如果没有，添加 pylint 注释作为第一行
-                        lines.insert(0, "# pylint: disable-all\n")
-                    
-                    # 重写文件内容
-                    f.seek(0)
-                    f.writelines(lines)
-                    f.truncate()
-                    
-                print(f"已更新文件: {file_path}")  # 打印已更新的文件路径
-            except Exception as e:
-                print(f"处理文件 {file_path} 时出错: {e}")  # 捕获并打印错误信息
+for file_path in iter_python_files(root_dir):
+    try:
+        # 只读取第一行，已有 pylint 注释的文件直接跳过，不再重写
+        with open(file_path, "r", encoding="utf-8") as f:
+            first_line = f.readline()
+        if first_line == PYLINT_HEADER:
+            continue
+
+        with open(file_path, "r+", encoding="utf-8") as f:
+            lines = f.readlines()
+
+            # 如果文件的第一行已经是 pylint 注释，更新它
+            if lines and lines[0].startswith("# pylint: disable-all"):
+                lines[0] = PYLINT_HEADER
+            else:
+                # 如果没有，添加 pylint 注释作为第一行
+                lines.insert(0, PYLINT_HEADER)
+            
+            # 重写文件内容
+            f.seek(0)
+            f.writelines(lines)
+            f.truncate()
+            
+        print(f"已更新文件: {file_path}")  # 打印已更新的文件路径
+    except Exception as e:
+        print(f"处理文件 {file_path} 时出错: {e}")  # 捕获并打印错误信息
 
 print("所有文件已更新。")
 
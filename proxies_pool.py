@@ -1,15 +1,28 @@
 # pylint: disable-all
+import heapq
 import json
 import threading
 import time
-from threading import Lock, Condition
+from threading import Condition
 import random
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 每个线程独立的随机数生成器，避免多线程共享模块级 random 实例
+_thread_local = threading.local()
+
+def thread_rng():
+    rng = getattr(_thread_local, 'rng', None)
+    if rng is None:
+        rng = _thread_local.rng = random.Random()
+    return rng
+
 class ProxyData:
+    # 使用 __slots__ 去掉每个实例的 __dict__，大代理池下显著减少内存占用
+    __slots__ = ('info', 'timeout', 'banned', 'given_out_counter', 'timed_out_counter', 'used_counter')
+
     def __init__(self, proxy_info):
         self.info = proxy_info
         self.timeout = 0
@@ -33,8 +46,65 @@ class ProxyData:
     def unban(self):
         self.banned = False
 
-    def is_valid(self, ignore_timeout=False):
-        return (not self.banned) and (ignore_timeout or self.timeout < time.time())
+    def is_valid(self, ignore_timeout=False, now=None):
+        if now is None:
+            now = time.time()
+        return (not self.banned) and (ignore_timeout or self.timeout < now)
+
+class WeightTree:
+    """
+    树状数组（Fenwick tree），按位置保存权重，支持 O(log N) 的更新与按前缀和抽样。
+    """
+    def __init__(self):
+        self._weights = []
+        self._tree = [0.0]
+
+    def __len__(self):
+        return len(self._weights)
+
+    def _prefix(self, i):
+        total = 0.0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def total(self):
+        return self._prefix(len(self._weights))
+
+    def append(self, weight):
+        self._weights.append(weight)
+        i = len(self._weights)
+        # 新节点 i 覆盖区间 (i - lowbit(i), i]
+        self._tree.append(self._prefix(i - 1) - self._prefix(i - (i & -i)) + weight)
+
+    def pop(self):
+        # 最后一个位置不被任何其他节点覆盖，直接删除即可
+        self._tree.pop()
+        return self._weights.pop()
+
+    def get(self, pos):
+        return self._weights[pos]
+
+    def set(self, pos, weight):
+        delta = weight - self._weights[pos]
+        self._weights[pos] = weight
+        i = pos + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        # 返回前缀和首次超过 value 的位置
+        pos = 0
+        bit = 1 << (len(self._weights).bit_length() - 1) if self._weights else 0
+        while bit:
+            nxt = pos + bit
+            if nxt < len(self._tree) and self._tree[nxt] <= value:
+                pos = nxt
+                value -= self._tree[nxt]
+            bit >>= 1
+        return min(pos, len(self._weights) - 1)
 
 class ProxyPool:
     def __init__(self, proxies, max_give_outs=0, max_time_outs=0, max_uses=0, time_out_on_use=0, replenish_proxies_func=None):
@@ -43,12 +113,23 @@ class ProxyPool:
         self.max_uses = max_uses
         self.time_out_on_use = time_out_on_use
 
+        # 补充代理期间置为 True，其他线程在条件变量上等待补充完成
         self._replenish_condition = Condition()
-        self._replenish_lock = Lock()
+        self._replenishing = False
 
         self.replenish_proxies_func = replenish_proxies_func
 
-        self._proxy_dict = {a['name']: ProxyData(a) for a in proxies}
+        # 保护代理状态与索引的短锁：计数器修改与重新索引必须一起完成，只读的有效性检查不加锁
+        self._state_lock = threading.Lock()
+
+        self._proxy_dict = {}
+        # 可分配代理的索引：列表与权重树按位置对应，字典记录名称在列表中的位置
+        self._available_list = []
+        self._available_pos = {}
+        self._available_weights = WeightTree()
+        # (超时到期时间, 名称) 的最小堆，到期后重新检查代理是否可分配
+        self._timeout_heap = []
+        self.add_proxies(proxies)
 
     def __getitem__(self, item):
         try:
@@ -56,85 +137,201 @@ class ProxyPool:
         except KeyError as exc:
             raise Exception(f"Unknown proxy: {item}") from exc
 
+    def __len__(self):
+        # 可分配代理数量由索引增量维护，len(pool) 不再遍历全部代理
+        return self.available_proxy_count()
+
+    def proxy_weight(self, proxy):
+        # 剩余可用次数越多、超时次数越少的代理被选中的概率越大
+        if isinstance(proxy, str):
+            proxy = self._proxy_dict[proxy]
+        remaining = max(1, self.max_uses - proxy.used_counter) if self.max_uses > 0 else 1
+        return remaining / (1 + proxy.timed_out_counter)
+
+    def _index_add(self, name):
+        weight = self.proxy_weight(name)
+        pos = self._available_pos.get(name)
+        if pos is None:
+            self._available_pos[name] = len(self._available_list)
+            self._available_list.append(name)
+            self._available_weights.append(weight)
+        elif self._available_weights.get(pos) != weight:
+            self._available_weights.set(pos, weight)
+
+    def _index_remove(self, name):
+        pos = self._available_pos.pop(name, None)
+        if pos is None:
+            return
+        last = self._available_list.pop()
+        last_weight = self._available_weights.pop()
+        if last != name:
+            self._available_list[pos] = last
+            self._available_pos[last] = pos
+            self._available_weights.set(pos, last_weight)
+
+    def _choose_available(self):
+        # 按权重抽样
+        pos = self._available_weights.find(thread_rng().random() * self._available_weights.total())
+        return self._available_list[pos]
+
+    def _reindex(self, name, now=None):
+        # 代理状态变化后调用，保持可分配索引及权重与代理状态一致
+        proxy = self._proxy_dict.get(name)
+        if now is None:
+            now = time.time()
+        if proxy is not None and self._valid_to_give(proxy, now):
+            self._index_add(name)
+        else:
+            self._index_remove(name)
+        if proxy is not None and proxy.timeout >= now:
+            heapq.heappush(self._timeout_heap, (proxy.timeout, name))
+
+    def _expire_timeouts(self, now=None):
+        # 把已过超时时间的代理重新放回索引
+        if now is None:
+            now = time.time()
+        while self._timeout_heap and self._timeout_heap[0][0] < now:
+            _, name = heapq.heappop(self._timeout_heap)
+            proxy = self._proxy_dict.get(name)
+            if proxy is not None and self._valid_to_give(proxy, now):
+                self._index_add(name)
+
+    def _earliest_timeout(self):
+        # 被弹出的代理在状态恢复时会经由 _reindex 重新入堆，因此可以放心丢弃
+        heap = self._timeout_heap
+        while heap:
+            timeout, name = heap[0]
+            proxy = self._proxy_dict.get(name)
+            if proxy is not None and proxy.timeout == timeout and self._valid_to_give(proxy, None):
+                return timeout
+            heapq.heappop(heap)
+        return None
+
     def add_proxies(self, proxy_list):
-        for proxy in proxy_list:
-            self._proxy_dict[proxy['name']] = ProxyData(proxy)
+        now = time.time()
+        with self._state_lock:
+            for proxy in proxy_list:
+                self._proxy_dict[proxy['name']] = ProxyData(proxy)
+                self._reindex(proxy['name'], now)
 
     def remove_proxies(self, proxy_list):
-        for proxy in proxy_list:
-            self._proxy_dict.pop(proxy['name'], None)
+        with self._state_lock:
+            for proxy in proxy_list:
+                self._proxy_dict.pop(proxy['name'], None)
+                self._index_remove(proxy['name'])
 
     def clear_unusable(self):
-        to_remove = [k for k, v in self._proxy_dict.items() if not self.proxy_valid_to_use(v)]
-        for proxy in to_remove:
-            del self._proxy_dict[proxy]
+        now = time.time()
+        max_time_outs, max_uses = self.max_time_outs, self.max_uses
+        with self._state_lock:
+            to_remove = [k for k, v in self._proxy_dict.items()
+                         if v.banned or v.timeout >= now
+                         or (max_uses > 0 and v.used_counter >= max_uses)
+                         or (max_time_outs > 0 and v.timed_out_counter >= max_time_outs)]
+            for proxy in to_remove:
+                del self._proxy_dict[proxy]
+                self._index_remove(proxy)
 
     def available_proxy_count(self):
-        return sum(1 for v in self._proxy_dict.values() if self.proxy_valid_to_give(v))
+        with self._state_lock:
+            self._expire_timeouts()
+            return len(self._available_list)
 
     def get_proxy(self, prev_proxy=None, _replenish=True):
-        with self._replenish_condition:
-            while self._replenish_lock.locked():
-                self._replenish_condition.wait()
-
-        valid_proxies = [k for k, v in self._proxy_dict.items() if self.proxy_valid_to_give(v)]
-        if valid_proxies:
-            selected_proxy = random.choice(valid_proxies)
-            if prev_proxy:
-                self._proxy_dict[prev_proxy].given_out_counter -= 1
-            self._proxy_dict[selected_proxy].given_out_counter += 1
-            return selected_proxy
-
-        min_timeout = None
-        for proxy_str, prox_data in self._proxy_dict.items():
-            if self.proxy_valid_to_give(prox_data, ignore_timeout=True):
-                min_timeout = prox_data.timeout if min_timeout is None else min(min_timeout, prox_data.timeout)
-
-        if min_timeout is None:
-            if self.replenish_proxies_func and _replenish:
+        # 补充代理后用循环重试而不是递归调用；_replenish 置为 False 保证最多补充一次
+        while True:
+            # 先无锁读取标志位，只有正在补充时才获取条件变量；标志位只在锁内修改，锁内会再次检查
+            if self._replenishing:
                 with self._replenish_condition:
-                    self._replenish_lock.acquire()
-                    try:
-                        self.replenish_proxies_func(self)
-                        self._replenish_lock.release()
-                        self._replenish_condition.notify_all()
-                    except Exception as e:
-                        self._replenish_lock.release()
-                        self._replenish_condition.notify_all()
-                        logging.error(f"Error during replenishing proxies: {e}")
-                        raise e
-                return self.get_proxy(prev_proxy=prev_proxy, _replenish=False)
-            logging.warning("No valid proxies available")
-            raise Exception("No valid proxies available")
-        else:
-            raise Exception(f"One proxy will be available at {min_timeout}", min_timeout)
-
-    def proxy_valid_to_give(self, proxy, ignore_timeout=False):
+                    while self._replenishing:
+                        self._replenish_condition.wait()
+
+            # 同一次分配中的过期检查与重新索引共用一个时间戳
+            now = time.time()
+            with self._state_lock:
+                self._expire_timeouts(now)
+                if self._available_list:
+                    selected_proxy = self._choose_available()
+                    if prev_proxy and prev_proxy in self._proxy_dict:
+                        self._proxy_dict[prev_proxy].given_out_counter -= 1
+                        self._reindex(prev_proxy, now)
+                    self._proxy_dict[selected_proxy].given_out_counter += 1
+                    self._reindex(selected_proxy, now)
+                    return selected_proxy
+
+                # 没有可分配的代理时，最早恢复的代理就在堆顶；先弹出过期或已不可分配的条目
+                min_timeout = self._earliest_timeout()
+
+            if min_timeout is not None:
+                raise Exception(f"One proxy will be available at {min_timeout}", min_timeout)
+            if not (self.replenish_proxies_func and _replenish):
+                logging.warning("No valid proxies available")
+                raise Exception("No valid proxies available")
+
+            _replenish = False
+            with self._replenish_condition:
+                if self._replenishing:
+                    # 其他线程正在补充，等待其完成后直接重试
+                    while self._replenishing:
+                        self._replenish_condition.wait()
+                    continue
+                self._replenishing = True
+            # 补充过程可能很慢（网络请求），期间不持有条件变量的锁
+            try:
+                self.replenish_proxies_func(self)
+            except Exception as e:
+                logging.error(f"Error during replenishing proxies: {e}")
+                raise e
+            finally:
+                with self._replenish_condition:
+                    self._replenishing = False
+                    # 等待者只能通过 _replenishing 得知补充结束，必须全部唤醒，否则未被唤醒的线程会一直阻塞
+                    self._replenish_condition.notify_all()
+
+    def _valid_to_give(self, proxy, now):
+        # proxy_valid_to_give 的内联版本：同一批检查共用调用方传入的 now，now 为 None 时忽略超时
+        max_give_outs, max_time_outs, max_uses = self.max_give_outs, self.max_time_outs, self.max_uses
+        return not proxy.banned and (now is None or proxy.timeout < now) and \
+               (max_give_outs <= 0 or proxy.given_out_counter < max_give_outs) and \
+               (max_time_outs <= 0 or proxy.timed_out_counter < max_time_outs) and \
+               (max_uses <= 0 or proxy.used_counter < max_uses)
+
+    def proxy_valid_to_give(self, proxy, ignore_timeout=False, now=None):
+        # 批量检查多个代理时由调用方传入同一个 now，省去每个代理一次 time.time()
         if isinstance(proxy, str):
             proxy = self._proxy_dict[proxy]
         return (self.max_give_outs <= 0 or proxy.given_out_counter < self.max_give_outs) and \
                (self.max_time_outs <= 0 or proxy.timed_out_counter < self.max_time_outs) and \
                (self.max_uses <= 0 or proxy.used_counter < self.max_uses) and \
-               proxy.is_valid(ignore_timeout)
+               proxy.is_valid(ignore_timeout, now)
 
-    def proxy_valid_to_use(self, proxy):
+    def proxy_valid_to_use(self, proxy, now=None):
         if isinstance(proxy, str):
             proxy = self._proxy_dict[proxy]
         return (self.max_uses <= 0 or proxy.used_counter < self.max_uses) and \
                (self.max_time_outs <= 0 or proxy.timed_out_counter < self.max_time_outs) and \
-               proxy.is_valid()
+               proxy.is_valid(now=now)
 
+    # 以下方法会改变代理状态，必须经由代理池调用以保持索引同步
     def use_proxy(self, proxy):
-        self._proxy_dict[proxy].use(self.time_out_on_use)
+        with self._state_lock:
+            self._proxy_dict[proxy].use(self.time_out_on_use)
+            self._reindex(proxy)
 
     def timeout_proxy(self, proxy, time_sec):
-        self._proxy_dict[proxy].give_timeout(time_sec)
+        with self._state_lock:
+            self._proxy_dict[proxy].give_timeout(time_sec)
+            self._reindex(proxy)
 
     def ban_proxy(self, proxy):
-        self._proxy_dict[proxy].ban()
+        with self._state_lock:
+            self._proxy_dict[proxy].ban()
+            self._reindex(proxy)
 
     def unban_proxy(self, proxy):
-        self._proxy_dict[proxy].unban()
+        with self._state_lock:
+            self._proxy_dict[proxy].unban()
+            self._reindex(proxy)
 
 class Proxy:
 
@@ -0,0 +1,49 @@
+# pylint: disable-all
+import os
+import logging
+import tempfile
+
+import ddddocr
+import onnx
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 量化后的模型保存目录，StupidOCR 启动时若发现同名 INT8 模型会优先加载
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+# 只量化全连接和循环层；Conv 动态量化后变成 ConvInteger，在 CPU 上往往比 FP32 更慢
+QUANTIZE_OP_TYPES = ["MatMul", "Gemm", "LSTM", "GRU"]
+# 纯卷积的检测模型不做量化
+SKIP_MODELS = {"common_det.onnx"}
+
+def quantize_all():
+    """
+    将 ddddocr 自带 ONNX 模型中的全连接和循环层动态量化为 INT8。
+
+    依赖 onnx 包。量化后请用实际验证码样本同时对比识别准确率和推理速度，
+    不满足要求时删除 models 目录即可回退。
+
+    :return: None
+    """
+    package_dir = os.path.dirname(ddddocr.__file__)
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    for name in os.listdir(package_dir):
+        if not name.endswith(".onnx") or name in SKIP_MODELS:
+            continue
+        src_path = os.path.join(package_dir, name)
+        # 已量化或不含目标算子的模型（如 common_old.onnx）跳过
+        if not any(node.op_type in QUANTIZE_OP_TYPES for node in onnx.load(src_path).graph.node):
+            logger.info("Skipping %s: no float %s ops", src_path, "/".join(QUANTIZE_OP_TYPES))
+            continue
+        dst_path = os.path.join(MODELS_DIR, name[:-len(".onnx")] + ".int8.onnx")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 先做形状推断和图优化，量化器才能识别全部可量化的节点；符号形状推断需要 sympy，这里的模型用不到
+            preprocessed_path = os.path.join(tmp_dir, name)
+            quant_pre_process(src_path, preprocessed_path, skip_symbolic_shape=True)
+            quantize_dynamic(preprocessed_path, dst_path, op_types_to_quantize=QUANTIZE_OP_TYPES, weight_type=QuantType.QInt8)
+        logger.info("Quantized %s -> %s", src_path, dst_path)
+
+if __name__ == "__main__":
+    quantize_all()